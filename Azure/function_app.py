@@ -1,4 +1,7 @@
 import json
+import time
+from functools import lru_cache
+
 import azure.functions as func
 
 from azure.functions import HttpRequest, HttpResponse
@@ -9,12 +12,28 @@ from marshmallow import Schema, INCLUDE, EXCLUDE
 from marshmallow.fields import Integer, String, Boolean, List
 from marshmallow.exceptions import ValidationError
 
+try:
+    import orjson
+
+    def _dumps(data: dict) -> bytes:
+        '''Serialises response data to JSON bytes, passed directly to HttpResponse'''
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    def _dumps(data: dict) -> str:
+        '''Serialises response data to JSON, falling back to the standard library'''
+        return json.dumps(data)
+
 from catalyst_ngd_wrappers import *
 
 if os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING"):
     configure_azure_monitor()
 
 LOG_REQUEST_DETAILS: bool = os.environ.get('LOG_REQUEST_DETAILS', 'True') == 'True'
+try:
+    # Values <= 0 disable caching of latest collection lookups
+    LATEST_COLLECTIONS_CACHE_SECONDS: int = int(os.environ.get('LATEST_COLLECTIONS_CACHE_SECONDS', '900'))
+except ValueError:
+    LATEST_COLLECTIONS_CACHE_SECONDS: int = 900
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
 class LatestCollectionsSchema(Schema):
@@ -78,13 +97,122 @@ class LimitGeomColSchema(LimitSchema, GeomSchema, ColSchema):
     wkt = String(required=True)
 
 
+# Schemas are instantiated once at import, rather than per request
+_SCHEMAS: dict[type, Schema] = {
+    schema_class: schema_class()
+    for schema_class in (
+        LatestCollectionsSchema,
+        BaseSchema,
+        LimitSchema,
+        GeomSchema,
+        ColSchema,
+        LimitGeomSchema,
+        LimitColSchema,
+        GeomColSchema,
+        LimitGeomColSchema,
+    )
+}
+_SCHEMA_FIELD_KEYS: dict[type, frozenset] = {
+    schema_class: frozenset(schema.fields)
+    for schema_class, schema in _SCHEMAS.items()
+}
+# Catalyst attribute names substituted into wrapper error descriptions
+_SCHEMA_ATTRIBUTES: dict[type, str] = {
+    schema_class: ', '.join(x.replace('_', '-') for x in schema.fields if x != 'limit')
+    for schema_class, schema in _SCHEMAS.items()
+}
+
+
+def _cache_bucket() -> int:
+    '''Returns the current time window, used to expire cached collection lookups'''
+    return int(time.time() // LATEST_COLLECTIONS_CACHE_SECONDS)
+
+
+class _UncachedResponse(Exception):
+    '''Carries an error payload out of a cached helper, so that lru_cache does not store it'''
+
+    def __init__(self, data: dict):
+        super().__init__()
+        self.data = data
+
+
+def _latest_collections_kwargs(flag_recent_updates: bool, recent_update_days: int) -> dict:
+    '''Returns only the supplied options, leaving the upstream defaults in place for the rest'''
+    kwargs = {
+        'flag_recent_updates': flag_recent_updates,
+        'recent_update_days': recent_update_days,
+    }
+    return {k: v for k, v in kwargs.items() if v is not None}
+
+
+def _raise_if_error(data: dict) -> dict:
+    '''Raises _UncachedResponse for error payloads, so they are returned but not cached'''
+    if isinstance(data, dict) and (data.get('errorSource') or 'code' in data):
+        raise _UncachedResponse(data)
+    return data
+
+
+@lru_cache(maxsize=4)
+def _cached_latest_collection_versions(
+        flag_recent_updates: bool,
+        recent_update_days: int,
+        bucket: int
+    ) -> dict:
+    '''Caches get_latest_collection_versions per time window, as the NGD collections list changes at most daily'''
+    kwargs = _latest_collections_kwargs(flag_recent_updates, recent_update_days)
+    return _raise_if_error(get_latest_collection_versions(**kwargs))
+
+
+@lru_cache(maxsize=64)
+def _cached_specific_latest_collections(
+        collections: tuple,
+        flag_recent_updates: bool,
+        recent_update_days: int,
+        bucket: int
+    ) -> dict:
+    '''Caches get_specific_latest_collections per time window'''
+    kwargs = _latest_collections_kwargs(flag_recent_updates, recent_update_days)
+    return _raise_if_error(get_specific_latest_collections(list(collections), **kwargs))
+
+
+def _latest_collection_versions(
+        flag_recent_updates: bool = None,
+        recent_update_days: int = None
+    ) -> dict:
+    '''Returns the latest collection versions, cached within the current time window'''
+    if LATEST_COLLECTIONS_CACHE_SECONDS <= 0:
+        kwargs = _latest_collections_kwargs(flag_recent_updates, recent_update_days)
+        return get_latest_collection_versions(**kwargs)
+    try:
+        return _cached_latest_collection_versions(flag_recent_updates, recent_update_days, _cache_bucket())
+    except _UncachedResponse as e:
+        return e.data
+
+
+def _specific_latest_collections(
+        collections: list,
+        flag_recent_updates: bool = None,
+        recent_update_days: int = None
+    ) -> dict:
+    '''Returns the latest versions of the given collections, cached within the current time window'''
+    if LATEST_COLLECTIONS_CACHE_SECONDS <= 0:
+        kwargs = _latest_collections_kwargs(flag_recent_updates, recent_update_days)
+        return get_specific_latest_collections(list(collections), **kwargs)
+    try:
+        return _cached_specific_latest_collections(
+            tuple(collections), flag_recent_updates, recent_update_days, _cache_bucket()
+        )
+    except _UncachedResponse as e:
+        return e.data
+
+
 @app.function_name('http_latest_collections')
 @app.route("catalyst/features/latest-collections")
 def http_latest_collections(req: HttpRequest) -> HttpResponse:
 
     if req.method != 'GET':
         code = 405
-        error_body = json.dumps({
+        error_body = _dumps({
             "code": code,
             "description": "The HTTP method requested is not supported. This endpoint only supports 'GET' requests.",
             "errorSource": "Catalyst Wrapper"
@@ -95,7 +223,7 @@ def http_latest_collections(req: HttpRequest) -> HttpResponse:
             status_code=code
         )
 
-    schema = LatestCollectionsSchema()
+    schema = _SCHEMAS[LatestCollectionsSchema]
 
     params = {**req.params}
 
@@ -103,7 +231,7 @@ def http_latest_collections(req: HttpRequest) -> HttpResponse:
         parsed_params = schema.load(params)
     except ValidationError as e:
         code = 400
-        error_body = json.dumps({
+        error_body = _dumps({
             "code": code,
             "description": str(e),
             "errorSource": "Catalyst Wrapper"
@@ -114,8 +242,8 @@ def http_latest_collections(req: HttpRequest) -> HttpResponse:
             status_code=400
         )
 
-    data = get_latest_collection_versions(**parsed_params)
-    json_data = json.dumps(data)
+    data = _latest_collection_versions(**parsed_params)
+    json_data = _dumps(data)
 
     custom_dimensions = {f'query_params.{str(k)}': str(v) for k, v in parsed_params.items()}
     custom_dimensions.pop('key', None)
@@ -139,7 +267,7 @@ def http_latest_single_col(req: HttpRequest) -> HttpResponse:
 
     if req.method != 'GET':
         code = 405
-        error_body = json.dumps({
+        error_body = _dumps({
             "code": code,
             "description": "The HTTP method requested is not supported. This endpoint only supports 'GET' requests.",
             "errorSource": "Catalyst Wrapper"
@@ -150,7 +278,7 @@ def http_latest_single_col(req: HttpRequest) -> HttpResponse:
             status_code=code
         )
 
-    schema = LatestCollectionsSchema()
+    schema = _SCHEMAS[LatestCollectionsSchema]
     collection = req.route_params.get('collection')
 
     params = {**req.params}
@@ -158,7 +286,7 @@ def http_latest_single_col(req: HttpRequest) -> HttpResponse:
         parsed_params = schema.load(params)
     except ValidationError as e:
         code = 400
-        error_body = json.dumps({
+        error_body = _dumps({
             "code": code,
             "description": str(e),
             "errorSource": "Catalyst Wrapper"
@@ -169,8 +297,8 @@ def http_latest_single_col(req: HttpRequest) -> HttpResponse:
             status_code=code
         )
 
-    data = get_specific_latest_collections([collection], **parsed_params)
-    json_data = json.dumps(data)
+    data = _specific_latest_collections([collection], **parsed_params)
+    json_data = _dumps(data)
 
     custom_dimensions = {f'query_params.{str(k)}': str(
         v) for k, v in parsed_params.items()}
@@ -189,18 +317,12 @@ def http_latest_single_col(req: HttpRequest) -> HttpResponse:
     )
 
 
-def delistify(params: dict) -> None:
-    for k, v in params.items():
-        if k != 'collection':
-            params[k] = v[0]
-
-
 def construct_response(req: HttpRequest, schema_class: type, func: callable) -> HttpResponse:
 
     try:
         if req.method != 'GET':
             code = 405
-            error_body = json.dumps({
+            error_body = _dumps({
                 "code": code,
                 "description": "The HTTP method requested is not supported. This endpoint only supports 'GET' requests.",
                 "errorSource": "Catalyst Wrapper"
@@ -211,20 +333,20 @@ def construct_response(req: HttpRequest, schema_class: type, func: callable) ->
                 status_code=code
             )
 
-        schema = schema_class()
+        schema = _SCHEMAS[schema_class]
         collection = req.route_params.get('collection')
 
-        params = {**req.params}
+        params = req.params
 
         if not (collection):
             col = params.get('collection')
             if col:
-                params['collection'] = params.get('collection').split(',')
+                params = {**params, 'collection': col.split(',')}
         try:
             parsed_params = schema.load(params)
         except ValidationError as e:
             code = 400
-            error_body = json.dumps({
+            error_body = _dumps({
                 "code": code,
                 "description": str(e),
                 "errorSource": "Catalyst Wrapper"
@@ -237,8 +359,7 @@ def construct_response(req: HttpRequest, schema_class: type, func: callable) ->
 
         custom_params = {
             k: parsed_params.pop(k)
-            for k in schema.fields.keys()
-            if k in parsed_params
+            for k in _SCHEMA_FIELD_KEYS[schema_class] & parsed_params.keys()
         }
         if collection:
             custom_params['collection'] = collection
@@ -252,16 +373,14 @@ def construct_response(req: HttpRequest, schema_class: type, func: callable) ->
 
         descr = data.get('description')
         if data.get('errorSource') and isinstance(descr, str):
-            fields = [x.replace('_', '-') for x in schema.fields if x != 'limit']
-            attributes = ', '.join(fields)
-            data['description'] = descr.format(attr=attributes)
+            data['description'] = descr.format(attr=_SCHEMA_ATTRIBUTES[schema_class])
 
         if LOG_REQUEST_DETAILS:
             custom_dimensions = data.pop('telemetryData', None)
             if custom_dimensions:
                 track_event('OS NGD API - Features', custom_dimensions=custom_dimensions)
 
-        json_data = json.dumps(data)
+        json_data = _dumps(data)
         return HttpResponse(
             body=json_data,
             mimetype="application/json"
@@ -269,7 +388,7 @@ def construct_response(req: HttpRequest, schema_class: type, func: callable) ->
     except Exception as e:
         code = 500
         error_string = str(e)
-        error_response = json.dumps({
+        error_response = _dumps({
             "code": code,
             "description": error_string,
             "errorSource": "Catalyst Wrapper"
@@ -281,89 +400,31 @@ def construct_response(req: HttpRequest, schema_class: type, func: callable) ->
         )
 
 
-@app.function_name('http_base')
-@app.route("catalyst/features/{collection}/items")
-def http_base(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        BaseSchema,
-        items
-    )
-    return response
-
-
-@app.function_name('http_limit')
-@app.route("catalyst/features/{collection}/items/limit")
-def http_limit(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        LimitSchema,
-        items_limit
-    )
-    return response
+def _register_items_route(function_name: str, route: str, schema_class: type, items_func: callable) -> None:
+    '''Registers an items endpoint, validated against schema_class and answered by items_func'''
 
+    @app.function_name(function_name)
+    @app.route(route)
+    def http_items(req: HttpRequest) -> HttpResponse:
+        return construct_response(req, schema_class, items_func)
 
-@app.function_name('http_geom')
-@app.route("catalyst/features/{collection}/items/geom")
-def http_geom(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        GeomSchema,
-        items_geom
-    )
-    return response
 
-
-@app.function_name('http_col')
-@app.route("catalyst/features/multi-collection/items/col")
-def http_col(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        ColSchema,
-        items_col
-    )
-    return response
+_ITEMS_ROUTES: tuple[tuple[str, str, type, callable], ...] = (
+    ('http_base', 'catalyst/features/{collection}/items', BaseSchema, items),
+    ('http_limit', 'catalyst/features/{collection}/items/limit', LimitSchema, items_limit),
+    ('http_geom', 'catalyst/features/{collection}/items/geom', GeomSchema, items_geom),
+    ('http_col', 'catalyst/features/multi-collection/items/col', ColSchema, items_col),
+    ('http_limit_geom', 'catalyst/features/{collection}/items/limit-geom', LimitGeomSchema, items_limit_geom),
+    ('http_limit_col', 'catalyst/features/multi-collection/items/limit-col', LimitColSchema, items_limit_col),
+    ('http_geom_col', 'catalyst/features/multi-collection/items/geom-col', GeomColSchema, items_geom_col),
+    ('http_limit_geom_col', 'catalyst/features/multi-collection/items/limit-geom-col', LimitGeomColSchema, items_limit_geom_col),
+)
 
 
-@app.function_name('http_limit_geom')
-@app.route("catalyst/features/{collection}/items/limit-geom")
-def http_limit_geom(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        LimitGeomSchema,
-        items_limit_geom
-    )
-    return response
+def _register_items_routes() -> None:
+    '''Registers every endpoint in _ITEMS_ROUTES'''
+    for route_spec in _ITEMS_ROUTES:
+        _register_items_route(*route_spec)
 
 
-@app.function_name('http_limit_col')
-@app.route("catalyst/features/multi-collection/items/limit-col")
-def http_limit_col(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        LimitColSchema,
-        items_limit_col
-    )
-    return response
-
-
-@app.function_name('http_geom_col')
-@app.route("catalyst/features/multi-collection/items/geom-col")
-def http_geom_col(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        GeomColSchema,
-        items_geom_col
-    )
-    return response
-
-
-@app.function_name('http_limit_geom_col')
-@app.route("catalyst/features/multi-collection/items/limit-geom-col")
-def http_limit_geom_col(req: HttpRequest) -> HttpResponse:
-    response = construct_response(
-        req,
-        LimitGeomColSchema,
-        items_limit_geom_col
-    )
-    return response
+_register_items_routes()